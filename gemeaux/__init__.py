@@ -1,11 +1,15 @@
-import collections
+import asyncio
+import queue
 import ssl
 import sys
+import threading
 import time
 from argparse import ArgumentParser
-from socket import AF_INET, SOCK_STREAM, socket
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from ssl import PROTOCOL_TLS_SERVER, SSLContext
-from urllib.parse import urlparse
+from string import ascii_letters, digits
 
 from .exceptions import (
     BadRequestException,
@@ -35,6 +39,10 @@ from .responses import (
 
 __version__ = "0.0.3.dev0"
 
+# Allowed types for the url configuration values
+URL_VALUE_TYPES = (Handler, Response)
+SCHEME_CHARS = frozenset(ascii_letters + digits + "+-.")
+
 
 class ZeroConfig:
     ip = "localhost"
@@ -42,36 +50,56 @@ class ZeroConfig:
     certfile = "cert.pem"
     keyfile = "key.pem"
     nb_connections = 5
+    quiet = False
+    reuse_port = False
+
+
+def get_parser():
+    """
+    Return the command line argument parser.
+    """
+    parser = ArgumentParser("Gemeaux: a Python Gemini server")
+    parser.add_argument(
+        "--ip",
+        default="localhost",
+        help="IP/Host of your server — default: localhost.",
+    )
+    parser.add_argument(
+        "--port", default=1965, type=int, help="Listening port — default: 1965."
+    )
+    parser.add_argument("--certfile", default="cert.pem")
+    parser.add_argument("--keyfile", default="key.pem")
+    parser.add_argument(
+        "--nb-connections",
+        default=5,
+        type=int,
+        help="Maximum number of connections — default: 5",
+    )
+    parser.add_argument(
+        "--quiet",
+        help="Do not log access to the server",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--reuse-port",
+        help="Let several server processes listen to the same port (Linux, BSD)",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--version",
+        help="Return version and exits",
+        action="store_true",
+        default=False,
+    )
+    return parser
 
 
 class ArgsConfig:
     def __init__(self):
 
-        parser = ArgumentParser("Gemeaux: a Python Gemini server")
-        parser.add_argument(
-            "--ip",
-            default="localhost",
-            help="IP/Host of your server — default: localhost.",
-        )
-        parser.add_argument(
-            "--port", default=1965, type=int, help="Listening port — default: 1965."
-        )
-        parser.add_argument("--certfile", default="cert.pem")
-        parser.add_argument("--keyfile", default="key.pem")
-        parser.add_argument(
-            "--nb-connections",
-            default=5,
-            type=int,
-            help="Maximum number of connections — default: 5",
-        )
-        parser.add_argument(
-            "--version",
-            help="Return version and exits",
-            action="store_true",
-            default=False,
-        )
-
-        args = parser.parse_args()
+        args = get_parser().parse_args()
 
         if args.version:
             sys.exit(__version__)
@@ -81,46 +109,92 @@ class ArgsConfig:
         self.certfile = args.certfile
         self.keyfile = args.keyfile
         self.nb_connections = args.nb_connections
+        self.quiet = args.quiet
+        self.reuse_port = args.reuse_port
+
+
+@lru_cache(maxsize=1024)
+def parse_url(url):
+    """
+    Split a URL into a ``(scheme, host, port, path, query)`` tuple.
+
+    A single-pass replacement for ``urlparse``, specialized for Gemini URLs. The
+    scheme defaults to ``gemini``, the port is ``None`` if not provided, and the
+    fragment is dropped.
+    """
+    url = url.strip()
+    scheme, sep, rest = url.partition("://")
+    if sep:
+        # Netloc ends with the first path, query or fragment delimiter.
+        end = len(rest)
+        for char in "/?#":
+            index = rest.find(char, 0, end)
+            if index != -1:
+                end = index
+        netloc, rest = rest[:end], rest[end:]
+    else:
+        scheme, netloc, rest = "gemini", "", url
+    rest = rest.partition("#")[0]
+    path, _, query = rest.partition("?")
+    host, sep, port = netloc.partition(":")
+    return scheme, host, port if sep else None, path, query
 
 
 def get_path(url):
     """
     Parse a URL and return a path relative to the root
     """
-    url = url.strip()
-    parsed = urlparse(url, "gemini")
-    path = parsed.path
-    return path
+    return parse_url(url)[3]
+
+
+@lru_cache(maxsize=128)
+def get_not_found_response(reason):
+    """
+    Return a ``NotFoundResponse`` for this reason, shared between requests.
+    """
+    return NotFoundResponse(reason)
+
+
+def get_scheme(url):
+    """
+    Return the lowercased scheme of the URL, or ``None`` if it has none.
+
+    Same rules as ``urlparse``: letters, digits, ``+``, ``-`` or ``.`` before the
+    first colon, starting with a letter.
+    """
+    scheme, colon, _ = url.partition(":")
+    if colon and scheme and scheme[0] in ascii_letters:
+        if SCHEME_CHARS.issuperset(scheme):
+            return scheme.lower()
+    return None
 
 
 def check_url(url, server_port):
     """
     Check for the client URL conformity.
 
-    Raise exception or return None
+    Cheap checks on the raw URL come first, the URL is only parsed to check its
+    port. Raise exception or return True
     """
-    parsed = urlparse(url, "gemini")
-
     # Check for bad request
-    # Note: the URL will be cleaned before being used
     if not url.endswith("\r\n"):
         # TimeoutException will cause no response
-        raise TimeoutException((url, parsed))
-    # Other than Gemini will trigger a PROXY ERROR
-    if parsed.scheme != "gemini":
-        raise ProxyRequestRefusedException
-    # You need to provide the right scheme
-    if not url.startswith("gemini://"):
+        raise TimeoutException(url)
+    # URL max length is 1024, CRLF excluded.
+    if len(url) > 1026:
         # BadRequestException will return BadRequestResponse
         raise BadRequestException
-    # URL max length is 1024.
-    if len(url.strip()) > 1024:
+    if not url.startswith("gemini://"):
+        # Other than Gemini will trigger a PROXY ERROR
+        if get_scheme(url) not in (None, "gemini"):
+            raise ProxyRequestRefusedException
+        # You need to provide the right scheme
         # BadRequestException will return BadRequestResponse
         raise BadRequestException
-    # Not the right port
-    if ":" in parsed.netloc:
-        location, port = parsed.netloc.split(":")
-        if int(port) != server_port:
+    # Not the right port. No colon after the scheme means no port to check.
+    if ":" in url[9:]:
+        port = parse_url(url)[2]
+        if port is not None and int(port) != server_port:
             raise ProxyRequestRefusedException
     return True
 
@@ -128,13 +202,31 @@ def check_url(url, server_port):
 class App:
 
     TIMESTAMP_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
+    ROUTE_CACHE_SIZE = 1024
+    URL_MAX_LENGTH = 1024
+    # Seconds a client is given to complete its TLS handshake.
+    HANDSHAKE_TIMEOUT = 10
+    # Seconds given to the client to send its request, once connected.
+    REQUEST_TIMEOUT = 10
+    # Exception class -> response to send. The closest class in the exception MRO
+    # wins. ``None`` means the client is gone. Responses are shared by all requests.
+    EXCEPTION_RESPONSES = {
+        OSError: PermanentFailureResponse("OS Error"),
+        ssl.SSLError: PermanentFailureResponse("SSL Error"),
+        UnicodeDecodeError: BadRequestResponse("Unicode Decode Error"),
+        BadRequestException: BadRequestResponse(),
+        asyncio.LimitOverrunError: BadRequestResponse(),
+        ProxyRequestRefusedException: ProxyRequestRefusedResponse(),
+        ConnectionResetError: None,
+    }
+    NOT_FOUND_RESPONSE = NotFoundResponse()
     BANNER = f"""
 ♊ Welcome to your Gémeaux server (v{__version__}) ♊
 """
 
     def __init__(self, urls, config=None):
         # Check the urls
-        if not isinstance(urls, collections.Mapping):
+        if not isinstance(urls, Mapping):
             # Not of the dict type
             raise ImproperlyConfigured("Bad url configuration: not a dict or dict-like")
 
@@ -143,102 +235,221 @@ class App:
             raise ImproperlyConfigured("Bad url configuration: empty dict")
 
         for k, v in urls.items():
-            if not isinstance(v, (Handler, Response)):
+            if not isinstance(v, URL_VALUE_TYPES):
                 msg = f"URL configuration: wrong type for `{k}`. Should be of type Handler or Response."
                 raise ImproperlyConfigured(msg)
 
+        # Static responses never change: serialize them once and for all.
+        for value in urls.values():
+            if not isinstance(value, Response):
+                continue
+            # Big binary documents are streamed from their file, never serialized.
+            if getattr(value, "content", True) is None:
+                continue
+            try:
+                bytes(value)
+            except Exception:
+                # The error will be handled when the response is requested.
+                pass
+
         self.urls = urls
-        self.config = config or ArgsConfig()
+        self._trie = self.build_trie(urls)
+        # URL -> function returning the response, for handlers.
+        self._views = {
+            k_url: self.get_view(k_value)
+            for k_url, k_value in urls.items()
+            if isinstance(k_value, Handler)
+        }
+        # Exact matches don't need to walk the trie.
+        self._exact = {k_url: (k_url, k_value) for k_url, k_value in urls.items()}
+        # The url configuration never changes, so route lookups can be memoized.
+        self._resolve = lru_cache(maxsize=self.ROUTE_CACHE_SIZE)(self._resolve)
+        self._config = config
+        self._timestamp_second = None
+        self._timestamp = ""
+        # Responses are built in worker threads, that may log errors too.
+        self._log_lock = threading.Lock()
+        # While the server runs, logs are written by a dedicated thread.
+        self._log_queue = None
+
+    @property
+    def config(self):
+        """
+        Return the configuration. Command line args are only parsed when needed.
+        """
+        if self._config is None:
+            self._config = ArgsConfig()
+        return self._config
+
+    @staticmethod
+    def get_view(handler):
+        """
+        Return the handler method to call for building responses.
+
+        Unless ``handle`` is overridden, it only calls ``get_response``: in that case,
+        ``get_response`` is called directly.
+        """
+        if type(handler).handle is Handler.handle:
+            return handler.get_response
+        return handler.handle
+
+    @staticmethod
+    def build_trie(urls):
+        """
+        Build a prefix trie out of the url configuration.
+
+        Each node is a dict of characters to child nodes. A node that ends a URL
+        prefix stores its ``(url, value)`` couple under the ``None`` key. The
+        catchall (``""``) is stored on the root node.
+        """
+        trie = {}
+        for k_url, k_value in urls.items():
+            node = trie
+            for char in k_url:
+                node = node.setdefault(char, {})
+            node[None] = (k_url, k_value)
+        return trie
 
     def log(self, message, error=False):
         """
         Log to standard output
+
+        While the server runs, messages are queued, so a slow or blocked output
+        never stalls the event loop or the workers.
+        """
+        if self._log_queue is not None:
+            self._log_queue.put((message, error))
+        else:
+            self.write_log(message, error)
+
+    def write_log(self, message, error=False):
+        """
+        Write the log message to the standard output, or error output.
         """
         out = sys.stdout
         if error:
             out = sys.stderr
-        print(message, file=out)
+        with self._log_lock:
+            print(message, file=out)
+
+    def log_writer(self, log_queue):
+        """
+        Write the queued log messages, until ``None`` is received.
+        """
+        while True:
+            item = log_queue.get()
+            if item is None:
+                break
+            self.write_log(*item)
 
-    def log_access(self, address, url, response=None):
+    def start_log_writer(self):
+        """
+        Start the log writer thread, and return it.
+        """
+        self._log_queue = queue.Queue()
+        thread = threading.Thread(
+            target=self.log_writer, args=(self._log_queue,), daemon=True
+        )
+        thread.start()
+        return thread
+
+    def stop_log_writer(self, thread):
+        """
+        Stop the log writer thread, once all the queued messages are written.
+        """
+        log_queue, self._log_queue = self._log_queue, None
+        log_queue.put(None)
+        thread.join()
+
+    def get_timestamp(self):
+        """
+        Return the formatted current time, computed at most once per second.
+        """
+        now = int(time.time())
+        if now != self._timestamp_second:
+            self._timestamp = time.strftime(self.TIMESTAMP_FORMAT, time.localtime(now))
+            self._timestamp_second = now
+        return self._timestamp
+
+    def log_access(self, address, url, response=None, sent=None):
         """
         Log for access to the server
+
+        ``sent`` is the number of bytes sent, defaults to the response length.
         """
+        if self.config.quiet:
+            return
         status = mimetype = "??"
         response_size = 0
-        if response:
+        if response is not None:
             error = response.status > 20
             status = response.status
-            response_size = len(response)
-            mimetype = response.mimetype.split(";")[0]
+            response_size = len(response) if sent is None else sent
+            mimetype = response.mimetype.partition(";")[0]
         else:
             error = True
-        message = '{} [{}] "{}" {} {} {}'.format(
-            address,
-            time.strftime(self.TIMESTAMP_FORMAT, time.localtime()),
-            url.strip(),
-            mimetype,
-            status,
-            response_size,
-        )
+        message = f'{address} [{self.get_timestamp()}] "{url.strip()}" {mimetype} {status} {response_size}'
         self.log(message, error=error)
 
     def get_route(self, path):
+        """
+        Return the ``(url, value)`` couple of the longest URL prefix matching the path.
 
-        matching = []
-
-        for k_url, k_value in self.urls.items():
-            if not k_url:  # Skip the catchall
-                continue
-            if path.startswith(k_url):
-                matching.append(k_url)
-
-        # One match or more. We'll take the "biggest" match.
-        if len(matching) >= 1:
-            k_url = max(matching, key=len)
-            return (k_url, self.urls[k_url])
-
-        # Catch all
-        if "" in self.urls:
-            return "", self.urls[""]
-
-        raise FileNotFoundError("Route Not Found")
+        Falls back to the catchall (``""``) if no other prefix matches.
+        """
+        route = self._exact.get(path)
+        if route is not None:
+            return route
+        return self._resolve(path)
 
-    def exception_handling(self, exception, connection):
+    def _resolve(self, path):
+        """
+        Walk the prefix trie to find the route for this path.
+        """
+        node = self._trie
+        route = node.get(None)
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                route = node[None]
+
+        if route is None:
+            raise FileNotFoundError("Route Not Found")
+        return route
+
+    def exception_handling(self, exception, writer):
         """
         Handle exceptions and errors when the client is requesting a resource.
         """
         response = None
-        if isinstance(exception, OSError):
-            response = PermanentFailureResponse("OS Error")
-        elif isinstance(exception, (ssl.SSLEOFError, ssl.SSLError)):
-            response = PermanentFailureResponse("SSL Error")
-        elif isinstance(exception, UnicodeDecodeError):
-            response = BadRequestResponse("Unicode Decode Error")
-        elif isinstance(exception, BadRequestException):
-            response = BadRequestResponse()
-        elif isinstance(exception, ProxyRequestRefusedException):
-            response = ProxyRequestRefusedResponse()
-        elif isinstance(exception, ConnectionResetError):
-            # No response sent
-            self.log("Connection reset by peer...", error=True)
+        for cls in type(exception).__mro__:
+            if cls in self.EXCEPTION_RESPONSES:
+                response = self.EXCEPTION_RESPONSES[cls]
+                if response is None:
+                    # No response sent
+                    self.log("Connection reset by peer...", error=True)
+                break
         else:
             self.log(f"Exception: {exception} / {type(exception)}", error=True)
 
         try:
-            if response and connection:
-                connection.sendall(bytes(response))
+            if response and writer:
+                writer.write(bytes(response))
         except Exception as exc:
             self.log(f"Exception while processing exception… {exc}", error=True)
 
     def get_response(self, url):
-        path = get_path(url)
+        # ``parse_url`` is memoized on the raw URL.
+        path = parse_url(url)[3]
         reason = None
         try:
             k_url, k_value = self.get_route(path)
-            if isinstance(k_value, Handler):
-                return k_value.handle(k_url, path)
-            elif isinstance(k_value, Response):
-                return k_value
+            view = self._views.get(k_url)
+            if view is not None:
+                return view(k_url, path)
+            return k_value
         except TemplateError as exc:
             if exc.args:
                 reason = exc.args[0]
@@ -248,33 +459,61 @@ class App:
                 reason = exc.args[0]
             self.log(f"Error: {type(exc)} / {reason}", error=True)
 
+        if reason is None:
+            return self.NOT_FOUND_RESPONSE
+        # Error messages are usually the same: "Path not found", etc.
+        if isinstance(reason, str):
+            return get_not_found_response(reason)
         return NotFoundResponse(reason)
 
-    def mainloop(self, tls):
-        while True:
-            connection = response = None
-            address = url = ""
-            do_log = False
-            try:
-                connection, (address, _) = tls.accept()
-                url = connection.recv(2048).decode()
-
-                # Check URL conformity.
-                check_url(url, self.port)
-
-                response = self.get_response(url)
-                connection.sendall(bytes(response))
-                do_log = True
-            except KeyboardInterrupt:
-                print("bye")
-                sys.exit()
-            except Exception as exc:
-                self.exception_handling(exc, connection)
-            finally:
-                if connection:
-                    connection.close()
-                if do_log:
-                    self.log_access(address, url, response)
+    async def handle_connection(self, reader, writer):
+        """
+        Handle a client connection: read the request URL, send back the response.
+        """
+        response = sent = None
+        address = writer.get_extra_info("peername")[0]
+        url = ""
+        do_log = False
+        try:
+            # The stream limit bounds the read to the URL max length + CRLF: longer
+            # requests are rejected before anything is decoded.
+            request = await asyncio.wait_for(
+                reader.readuntil(b"\r\n"), self.REQUEST_TIMEOUT
+            )
+            url = request.decode("utf-8")
+
+            # Check URL conformity.
+            check_url(url, self.port)
+            # From now on, the CRLF is not needed anymore.
+            url = url.strip()
+
+            # Building the response may hit the filesystem: keep it off the loop.
+            loop = asyncio.get_event_loop()
+            response = await loop.run_in_executor(None, self.get_response, url)
+            sent = await response.send(writer)
+            do_log = True
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            # The client closed the connection before sending the CRLF, or didn't
+            # send it in time.
+            # No response sent
+            pass
+        except Exception as exc:
+            self.exception_handling(exc, writer)
+        finally:
+            writer.close()
+            if do_log:
+                self.log_access(address, url, response, sent)
+
+    def get_ssl_context(self):
+        """
+        Return the server SSL context.
+
+        TLS session tickets are enabled by default in the ``ssl`` module, so
+        returning clients can already resume their session.
+        """
+        context = SSLContext(PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.config.certfile, self.config.keyfile)
+        return context
 
     def run(self):
         """
@@ -285,18 +524,46 @@ class App:
         """
         # Loading config only at runtime, not initialization
         self.port = self.config.port
-        context = SSLContext(PROTOCOL_TLS_SERVER)
-        context.load_cert_chain(self.config.certfile, self.config.keyfile)
-
-        with socket(AF_INET, SOCK_STREAM) as server:
-            server.bind((self.config.ip, self.config.port))
-            server.listen(self.config.nb_connections)
-            print(self.BANNER)
-            with context.wrap_socket(server, server_side=True) as tls:
-                print(
-                    f"Application started…, listening to {self.config.ip}:{self.config.port}"
-                )
-                self.mainloop(tls)
+        context = self.get_ssl_context()
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        executor = ThreadPoolExecutor(max_workers=self.config.nb_connections)
+        loop.set_default_executor(executor)
+        # TLS handshakes are run by the event loop, per connection: a slow client
+        # never blocks the others from being accepted.
+        extra = {}
+        # Python 3.7+ only
+        if sys.version_info >= (3, 7):
+            extra["ssl_handshake_timeout"] = self.HANDSHAKE_TIMEOUT
+        # The kernel balances the incoming connections between the processes.
+        if self.config.reuse_port:
+            extra["reuse_port"] = True
+        server = loop.run_until_complete(
+            asyncio.start_server(
+                self.handle_connection,
+                self.config.ip,
+                self.config.port,
+                ssl=context,
+                backlog=self.config.nb_connections,
+                # URL max length is 1024, plus the CRLF.
+                limit=self.URL_MAX_LENGTH + 2,
+                **extra,
+            )
+        )
+        print(self.BANNER)
+        print(f"Application started…, listening to {self.config.ip}:{self.config.port}")
+        log_writer = self.start_log_writer()
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            print("bye")
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
+            executor.shutdown()
+            self.stop_log_writer(log_writer)
 
 
 __all__ = [
@@ -1,7 +1,13 @@
-from os.path import abspath, isdir, isfile, join
+import os
+import threading
+import time
+from collections import OrderedDict
+from os.path import abspath, isabs, isdir, join, splitdrive
+from stat import S_ISDIR, S_ISREG
 
 from .exceptions import ImproperlyConfigured
 from .responses import (
+    FILE_CACHE,
     DirectoryListingResponse,
     DocumentResponse,
     RedirectResponse,
@@ -27,22 +33,163 @@ class Handler:
         return response
 
 
+class TTLCache:
+    """
+    Bounded mapping whose entries expire after ``ttl`` seconds.
+
+    If ``ttl`` is ``None``, entries never expire. Expired entries are dropped when
+    a new entry is set. When there are more than ``maxsize`` entries, or more than
+    ``maxbytes`` bytes (if given), the least recently set entries are evicted first.
+    """
+
+    def __init__(self, ttl, maxsize, maxbytes=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self._data = OrderedDict()
+        # Handlers are called from the worker threads.
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            if entry[1] is not None and entry[1] <= time.monotonic():
+                del self._data[key]
+                self.nbytes -= entry[2]
+                return default
+            return entry[0]
+
+    def set(self, key, value, size=0):
+        """
+        Store the value. ``size`` is its weight in bytes, for the ``maxbytes`` bound.
+        """
+        now = time.monotonic()
+        expires = None if self.ttl is None else now + self.ttl
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old:
+                self.nbytes -= old[2]
+            self._data[key] = (value, expires, size)
+            self.nbytes += size
+            while len(self._data) > self.maxsize or (
+                self.maxbytes is not None and self.nbytes > self.maxbytes
+            ):
+                self._pop_oldest()
+            # Entries are ordered by expiry time: drop the expired ones, so they
+            # don't stay in memory until they are looked up again.
+            if expires is not None:
+                while self._data and next(iter(self._data.values()))[1] <= now:
+                    self._pop_oldest()
+
+    def _pop_oldest(self):
+        _, entry = self._data.popitem(last=False)
+        self.nbytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+
+# Cache miss marker, for caches where ``None`` is a valid value.
+MISSING = object()
+
+
 class StaticHandler(Handler):
     """
     Handler for serving static Gemini pages from a directory on your filesystem.
     """
 
-    def __init__(self, static_dir, directory_listing=True, index_file="index.gmi"):
+    CACHE_SIZE = 1024
+    # Memory budget of the response cache, in bytes.
+    CACHE_BYTES = 16 * 1024 * 1024
+
+    def __init__(
+        self, static_dir, directory_listing=True, index_file="index.gmi", cache_ttl=1.0
+    ):
         self.static_dir = abspath(static_dir)
         if not isdir(self.static_dir):
             raise ImproperlyConfigured(f"{self.static_dir} is not a directory")
         self.directory_listing = directory_listing
         self.index_file = index_file
+        self._stat_cache = TTLCache(cache_ttl, self.CACHE_SIZE)
+        self._response_cache = TTLCache(cache_ttl, self.CACHE_SIZE, self.CACHE_BYTES)
+        # Listings are valid as long as their directory doesn't change.
+        self._listing_cache = TTLCache(None, self.CACHE_SIZE)
 
     def __repr__(self):
         return f"<StaticHandler: {self.static_dir}>"
 
+    def get_stat(self, full_path):
+        """
+        Return the ``os.stat`` result for this path, or ``None`` if there's no file.
+
+        The result is cached for ``cache_ttl`` seconds.
+        """
+        stat_result = self._stat_cache.get(full_path, MISSING)
+        if stat_result is MISSING:
+            try:
+                stat_result = os.stat(full_path)
+            except (OSError, ValueError):
+                stat_result = None
+            self._stat_cache.set(full_path, stat_result)
+        return stat_result
+
     def get_response(self, url, path):
+        """
+        Return the static page response, cached for ``cache_ttl`` seconds.
+
+        Directory listings are cached apart, until their directory is modified.
+        Responses holding files too big for the file cache are not cached either.
+        """
+        response = self._response_cache.get((url, path))
+        if response is None:
+            response = self.build_response(url, path)
+            if self.is_cacheable(response):
+                self._response_cache.set(
+                    (url, path), response, self.get_memory_size(response)
+                )
+        return response
+
+    def is_cacheable(self, response):
+        """
+        Return ``True`` if the response can be kept in the response cache.
+        """
+        if isinstance(response, DirectoryListingResponse):
+            return False
+        content = getattr(response, "content", None)
+        return content is None or len(content) <= FILE_CACHE.max_file_size
+
+    def get_memory_size(self, response):
+        """
+        Return the number of bytes the response keeps in memory.
+
+        Documents hold their content and their serialized bytes; streamed
+        documents hold neither.
+        """
+        content = getattr(response, "content", None)
+        if content is None:
+            return 0
+        return len(content) + len(response)
+
+    def get_listing(self, full_path, stat_result, trust_path=False):
+        """
+        Return the directory listing, built again only when the directory changes.
+
+        ``stat_result`` is the directory ``os.stat`` result. Adding, removing or
+        renaming an entry updates the directory ``mtime``.
+        """
+        key = (full_path, stat_result.st_mtime_ns)
+        response = self._listing_cache.get(key)
+        if response is None:
+            response = DirectoryListingResponse(full_path, self.static_dir, trust_path)
+            self._listing_cache.set(key, response)
+        return response
+
+    def build_response(self, url, path):
         """
         Return the static page response according to the configuration & file tree.
 
@@ -57,25 +204,42 @@ class StaticHandler(Handler):
         # A bit paranoid…
         if path.startswith(url):
             path = path[len(url) :]
-        if path.startswith("/"):  # Should be a relative path
-            path = path[1:]
+        path = path.lstrip("/")  # Should be a relative path
+
+        # Parent directories are out of reach, whatever the path is. Backslashes
+        # are path separators on Windows.
+        segments = path.split("/")
+        if ".." in segments or "\x00" in path or "\\" in path:
+            raise FileNotFoundError("Path not found")
+        # Drive paths (Windows) would make ``join`` discard the static directory.
+        if splitdrive(path)[0] or isabs(path):
+            raise FileNotFoundError("Path not found")
+        # Canonical paths don't need to be normalized again by the responses.
+        trust_path = "." not in segments and "" not in segments[:-1]
 
         full_path = join(self.static_dir, path)
         # print(f"StaticHandler: path='{full_path}'")
+        # A single stat result for all the decisions below: the cache may expire
+        # in the meantime.
+        stat_result = self.get_stat(full_path)
+        mode = stat_result.st_mode if stat_result else 0
         # The path leads to a directory
-        if isdir(full_path):
+        if S_ISDIR(mode):
             # Directory. Redirect if not root?
             if path and not path.endswith("/"):
                 return RedirectResponse(f"{path}/")
             # Directory -> index?
             index_path = join(full_path, self.index_file)
-            if isfile(index_path):
-                return DocumentResponse(index_path, self.static_dir)
+            index_stat = self.get_stat(index_path)
+            if index_stat and S_ISREG(index_stat.st_mode):
+                return DocumentResponse(
+                    index_path, self.static_dir, trust_path, index_stat
+                )
             elif self.directory_listing:
-                return DirectoryListingResponse(full_path, self.static_dir)
+                return self.get_listing(full_path, stat_result, trust_path)
         # The path is a file
-        elif isfile(full_path):
-            return DocumentResponse(full_path, self.static_dir)
+        elif S_ISREG(mode):
+            return DocumentResponse(full_path, self.static_dir, trust_path, stat_result)
         # Else, not found or error
         raise FileNotFoundError("Path not found")
 
@@ -1,7 +1,11 @@
+import asyncio
 import mimetypes
-from itertools import chain
-from os import listdir
-from os.path import abspath, isdir, isfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from os import scandir, sep, stat
+from os.path import abspath, basename, isdir, isfile
+from stat import S_ISREG
 from string import Template
 
 from .exceptions import TemplateError
@@ -16,13 +20,115 @@ MIMETYPES.add_type("text/gemini", ".gmi")
 MIMETYPES.add_type("text/gemini", ".gemini")
 
 
+class FileCache:
+    """
+    LRU cache of file contents, invalidated when the file changes on disk.
+
+    Files bigger than ``max_file_size`` are never cached. When there are more than
+    ``maxsize`` files or ``max_bytes`` bytes in the cache, least recently used
+    files are evicted first.
+    """
+
+    def __init__(
+        self, maxsize=128, max_bytes=16 * 1024 * 1024, max_file_size=1024 * 1024
+    ):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def read(self, path, stat_result):
+        """
+        Return the content of the file. ``stat_result`` is its current ``os.stat``.
+        """
+        version = (stat_result.st_mtime_ns, stat_result.st_size)
+        with self._lock:
+            entry = self._data.get(path)
+            if entry and entry[0] == version:
+                self._data.move_to_end(path)
+                return entry[1]
+
+        with open(path, "rb") as fd:
+            content = fd.read()
+        if len(content) > self.max_file_size:
+            return content
+
+        with self._lock:
+            old = self._data.pop(path, None)
+            if old:
+                self.nbytes -= len(old[1])
+            self._data[path] = (version, content)
+            self.nbytes += len(content)
+            while len(self._data) > self.maxsize or self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.nbytes -= len(evicted)
+        return content
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+
+FILE_CACHE = FileCache()
+
+
+@lru_cache(maxsize=256)
+def guess_mimetype(extensions):
+    """
+    Return the mimetype for these file extensions (without the leading dot).
+    """
+    mime, encoding = MIMETYPES.guess_type(f"file.{extensions}")
+    if encoding:
+        return f"{mime}; charset={encoding}"
+    else:
+        return mime or "application/octet-stream"
+
+
+@lru_cache(maxsize=128)
+def load_template(template_file, mtime_ns, size):
+    """
+    Return the ``string.Template`` for this file.
+
+    The file ``mtime_ns`` and ``size`` are part of the cache key: modified templates
+    are read again.
+    """
+    with open(template_file, "r") as fd:
+        return Template(fd.read())
+
+
+def check_path(full_path, root_dir):
+    """
+    Return the absolute version of ``full_path``.
+
+    Raise a ``FileNotFoundError`` if it doesn't belong to the ``root_dir`` directory.
+    """
+    full_path = abspath(full_path)
+    root_dir = root_dir.rstrip(sep)
+    # The separator prevents "/var/gemini-secret" from matching "/var/gemini".
+    if full_path != root_dir and not full_path.startswith(root_dir + sep):
+        raise FileNotFoundError("Forbidden path")
+    return full_path
+
+
 def crlf(text):
     r"""
     Normalize line endings to unix (``\r\n``). Text should be bytes.
     """
-    lines = text.splitlines()  # Will remove all types of linefeeds
-    lines = map(lambda x: x + b"\r\n", lines)  # append the "true" linefeed
-    return b"".join(lines)
+    # Already normalized text (the usual case for .gmi files) is returned as is.
+    if text.endswith(b"\r\n"):
+        nb_crlf = text.count(b"\r\n")
+        if text.count(b"\n") == nb_crlf and text.count(b"\r") == nb_crlf:
+            return text
+    if not text:
+        return b""
+    # All types of linefeeds become LF, then the "true" linefeed.
+    text = text.replace(b"\r\n", b"\n").replace(b"\r", b"\n").replace(b"\n", b"\r\n")
+    if not text.endswith(b"\r\n"):
+        text += b"\r\n"
+    return text
 
 
 class Response:
@@ -31,17 +137,16 @@ class Response:
     """
 
     mimetype = "text/gemini; charset=utf-8"
-
-    @property
-    def status(self):
-        raise NotImplementedError("You need to define this response `status` code.")
+    # Status code, to be defined in derivative classes.
+    status = None
 
     def __meta__(self):
         """
         Return the meta line (without the CRLF).
         """
-        meta = f"{self.status} {self.mimetype}"
-        return bytes(meta, encoding="utf-8")
+        if self.status is None:
+            raise NotImplementedError("You need to define this response `status` code.")
+        return f"{self.status} {self.mimetype}".encode("utf-8")
 
     def __body__(self):
         """
@@ -51,27 +156,29 @@ class Response:
 
     def __bytes__(self):
         """
-        Return the response sent via the connection
-        """
-        # Use cache whenever it's possible to avoid round trip with bool() in log
-        if hasattr(self, "__bytes"):
-            return getattr(self, "__bytes")
+        Return the response sent via the connection.
 
-        # Composed of the META line and the body
-        response = [self.__meta__(), self.__body__()]
-        # Only non-empty items are sent
-        response = filter(bool, response)
-        # Joining using the right linefeed separator
-        response = b"\r\n".join(response)
+        The response is serialized once, then cached on the instance.
+        """
+        wire = self.__dict__.get("_wire")
+        if wire is None:
+            wire = self._wire = self.serialize()
+        return wire
 
+    def serialize(self):
+        """
+        Build the response bytes: the META line, followed by the body, if any.
+        """
+        meta = self.__meta__()
+        body = self.__body__()
+        # Empty bodies are not sent
+        if not body:
+            return meta + b"\r\n"
         # Binary bodies should be returned as is.
-        if not self.mimetype.startswith("text/"):
-            setattr(self, "__bytes", response)
-            return response
-
-        response = crlf(response)
-        setattr(self, "__bytes", response)
-        return response
+        if self.mimetype.startswith("text/"):
+            body = crlf(body)
+        # A single copy of the (possibly big) body.
+        return b"".join((meta, b"\r\n", body))
 
     def __len__(self):
         """
@@ -79,6 +186,17 @@ class Response:
         """
         return len(bytes(self))
 
+    async def send(self, writer):
+        """
+        Send the response to the client through the stream writer.
+
+        Return the number of bytes sent.
+        """
+        wire = bytes(self)
+        writer.write(wire)
+        await writer.drain()
+        return len(wire)
+
 
 class SuccessResponse(Response):
     """
@@ -99,8 +217,7 @@ class InputResponse(Response):
         self.prompt = prompt
 
     def __meta__(self):
-        meta = f"{self.status} {self.prompt}"
-        return bytes(meta, encoding="utf-8")
+        return f"{self.status} {self.prompt}".encode("utf-8")
 
 
 class SensitiveInputResponse(InputResponse):
@@ -122,8 +239,7 @@ class RedirectResponse(Response):
         self.target = target
 
     def __meta__(self):
-        meta = f"{self.status} {self.target}"
-        return bytes(meta, encoding="utf-8")
+        return f"{self.status} {self.target}".encode("utf-8")
 
 
 class PermanentRedirectResponse(RedirectResponse):
@@ -147,8 +263,7 @@ class PermanentFailureResponse(Response):
         self.reason = reason
 
     def __meta__(self):
-        meta = f"{self.status} {self.reason}"
-        return bytes(meta, encoding="utf-8")
+        return f"{self.status} {self.reason}".encode("utf-8")
 
 
 class NotFoundResponse(Response):
@@ -164,8 +279,7 @@ class NotFoundResponse(Response):
         self.reason = reason
 
     def __meta__(self):
-        meta = f"{self.status} {self.reason}"
-        return bytes(meta, encoding="utf-8")
+        return f"{self.status} {self.reason}".encode("utf-8")
 
 
 class ProxyRequestRefusedResponse(Response):
@@ -176,8 +290,7 @@ class ProxyRequestRefusedResponse(Response):
     status = 53
 
     def __meta__(self):
-        meta = f"{self.status} PROXY REQUEST REFUSED"
-        return bytes(meta, encoding="utf-8")
+        return b"53 PROXY REQUEST REFUSED"
 
 
 class BadRequestResponse(Response):
@@ -193,8 +306,7 @@ class BadRequestResponse(Response):
         self.reason = reason
 
     def __meta__(self):
-        meta = f"{self.status} {self.reason}"
-        return bytes(meta, encoding="utf-8")
+        return f"{self.status} {self.reason}".encode("utf-8")
 
 
 # *** GEMEAUX CUSTOM RESPONSES ***
@@ -212,16 +324,13 @@ class TextResponse(SuccessResponse):
         * ``title``: The main title of the document. Will be flushed to the user as a 1st level title.
         * ``body``: The main content of the response. All line feeds will be converted into ``\\r\\n``.
         """
-        content = []
+        content = ""
         # Remove empty bodies
         if title:
-            content.append(f"# {title}")
-            content.append("")
+            content += f"# {title}\r\n\r\n"
         if body:
-            content.append(body)
-        content = map(lambda x: x + "\r\n", content)
-        content = "".join(content)
-        self.content = bytes(content, encoding="utf-8")
+            content += f"{body}\r\n"
+        self.content = content.encode("utf-8")
 
     def __body__(self):
         return self.content
@@ -234,7 +343,11 @@ class DocumentResponse(SuccessResponse):
     This reponse is the content a text document.
     """
 
-    def __init__(self, full_path, root_dir):
+    # Binary files smaller than this are read in memory, and sent in the same
+    # buffer as their header.
+    SENDFILE_MIN_SIZE = 64 * 1024
+
+    def __init__(self, full_path, root_dir, trust_path=False, stat_result=None):
         """
         Open the document and read its content.
 
@@ -242,33 +355,81 @@ class DocumentResponse(SuccessResponse):
 
         * full_path: The full path for the file you want to read.
         * root_dir: The root directory of your static content tree. The full document path should belong to this directory.
+        * trust_path: Skip the path normalization and root directory check, when the caller has already made sure the path is absolute, normalized and inside the root directory.
+        * stat_result: The ``os.stat`` result of the file, if the caller already has it.
         """
-        full_path = abspath(full_path)
-        if not full_path.startswith(root_dir):
-            raise FileNotFoundError("Forbidden path")
-        if not isfile(full_path):
+        if not trust_path:
+            full_path = check_path(full_path, root_dir)
+        if stat_result is None:
+            try:
+                stat_result = stat(full_path)
+            except (OSError, ValueError):
+                raise FileNotFoundError
+        if not S_ISREG(stat_result.st_mode):
             raise FileNotFoundError
-        with open(full_path, "rb") as fd:
-            self.content = fd.read()
+        self.full_path = full_path
+        self.size = stat_result.st_size
         self.mimetype = self.guess_mimetype(full_path)
+        self.meta = f"{self.status} {self.mimetype}".encode("utf-8")
+        # Text content has to be read for its linefeeds to be normalized.
+        if self.mimetype.startswith("text/") or self.size < self.SENDFILE_MIN_SIZE:
+            self.content = FILE_CACHE.read(full_path, stat_result)
+            # Serialize now: responses are built in worker threads, off the loop.
+            bytes(self)
+        else:
+            # Big binary content is streamed from the file when sent.
+            self.content = None
 
     def guess_mimetype(self, filename):
         """
         Guess the mimetype of a file based on the file extension.
         """
-        mime, encoding = MIMETYPES.guess_type(filename)
-        if encoding:
-            return f"{mime}; charset={encoding}"
-        else:
-            return mime or "application/octet-stream"
+        # Only the extensions matter: "archive.tar.gz" -> "tar.gz"
+        extensions = basename(filename).partition(".")[2]
+        return guess_mimetype(extensions)
 
     def __meta__(self):
-        meta = f"{self.status} {self.mimetype}"
-        return bytes(meta, encoding="utf-8")
+        return self.meta
 
     def __body__(self):
+        if self.content is None:
+            with open(self.full_path, "rb") as fd:
+                return fd.read()
         return self.content
 
+    def __len__(self):
+        if self.content is None:
+            return len(self.__meta__()) + 2 + self.size
+        return super().__len__()
+
+    async def send(self, writer):
+        """
+        Send binary files without loading them in memory.
+
+        The event loop ``sendfile()`` is zero-copy on plain sockets, and falls back
+        to a buffered read/write loop on TLS transports.
+        """
+        if self.content is not None:
+            # Small enough to go out as a single write, header included.
+            return await super().send(writer)
+
+        loop = asyncio.get_event_loop()
+        header = self.__meta__() + b"\r\n"
+        # The file may have been removed since the response was built: nothing is
+        # written until it's open, so an error response can still be sent.
+        with open(self.full_path, "rb") as fd:
+            writer.write(header)
+            # Python 3.7+ only
+            if hasattr(loop, "sendfile") and writer.transport:
+                await writer.drain()
+                sent = await loop.sendfile(writer.transport, fd)
+            else:
+                body = fd.read()
+                writer.write(body)
+                sent = len(body)
+        await writer.drain()
+        return len(header) + sent
+
 
 class DirectoryListingResponse(SuccessResponse):
     """
@@ -278,22 +439,25 @@ class DirectoryListingResponse(SuccessResponse):
     directory or if the path is not a sub-directory of the root path.
     """
 
-    def __init__(self, full_path, root_dir):
-        # Just in case
-        full_path = abspath(full_path)
-        if not full_path.startswith(root_dir):
-            raise FileNotFoundError("Forbidden path")
-        if not isdir(full_path):
-            raise FileNotFoundError
-        relative_path = full_path[len(root_dir) :]
-
-        heading = [f"# Directory listing for `{relative_path}`\r\n", "\r\n"]
-        body = listdir(full_path)
-        body = map(lambda x: f"=> {relative_path}/{x}\r\n", body)
-        body = chain(heading, body)
-        body = map(lambda item: bytes(item, encoding="utf8"), body)
-        body = list(body)
-        self.content = b"".join(body)
+    def __init__(self, full_path, root_dir, trust_path=False):
+        # With ``trust_path``, the caller has already checked the path is a
+        # normalized directory inside the root directory.
+        if not trust_path:
+            full_path = check_path(full_path, root_dir)
+            if not isdir(full_path):
+                raise FileNotFoundError
+        relative_path = full_path[len(root_dir) :].rstrip("/")
+
+        body = [f"# Directory listing for `{relative_path}`\r\n\r\n"]
+        # Directory entries know their type: no extra stat call per entry.
+        with scandir(full_path) as entries:
+            # Case-insensitive order; sort keys are computed once per entry.
+            entries = sorted(entries, key=lambda entry: entry.name.lower())
+        for entry in entries:
+            # Sub-directories links end with a slash, to avoid a redirection.
+            slash = "/" if entry.is_dir() else ""
+            body.append(f"=> {relative_path}/{entry.name}{slash}\r\n")
+        self.content = "".join(body).encode("utf-8")
 
     def __body__(self):
         return self.content
@@ -313,10 +477,16 @@ class TemplateResponse(SuccessResponse):
         * ``template_file``: full path to your template file.
         * ``context``: multiple variables to pass in your template as template variables.
         """
-        if not isfile(template_file):
+        try:
+            stat_result = stat(template_file)
+        except (OSError, ValueError):
+            stat_result = None
+        if stat_result is None or not S_ISREG(stat_result.st_mode):
             raise TemplateError(f"Template file not found: `{template_file}`")
-        with open(template_file, "r") as fd:
-            self.template = Template(fd.read())
+        # Templates are only read and parsed again when they change.
+        self.template = load_template(
+            template_file, stat_result.st_mtime_ns, stat_result.st_size
+        )
         self.context = context
 
     def __body__(self):
@@ -6,6 +6,8 @@ from gemeaux import Handler, Response, TemplateResponse
 
 
 class FakeResponse(Response):
+    status = 20
+
     def __init__(self, origin):
         self.origin = origin
 
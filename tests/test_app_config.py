@@ -1,8 +1,16 @@
-from unittest.mock import patch
+import threading
+from unittest.mock import call, patch
 
 import pytest
 
-from gemeaux import App, ImproperlyConfigured, ZeroConfig
+from gemeaux import (
+    App,
+    DocumentResponse,
+    ImproperlyConfigured,
+    TemplateError,
+    TemplateResponse,
+    ZeroConfig,
+)
 
 
 def test_no_urls():
@@ -35,3 +43,99 @@ def test_urls_handler(mock_ssl_context, fake_handler):
 def test_urls_response(mock_ssl_context, fake_response):
     app = App(urls={"": fake_response}, config=ZeroConfig())
     assert app
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_ssl_context(mock_ssl_context, fake_handler):
+    app = App(urls={"": fake_handler}, config=ZeroConfig())
+    app.get_ssl_context()
+    mock_ssl_context.assert_called_once_with("cert.pem", "key.pem")
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_urls_response_serialized(mock_ssl_context, fake_response):
+    App(urls={"": fake_response}, config=ZeroConfig())
+    assert fake_response._wire == b"20 text/gemini; charset=utf-8\r\n"
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_urls_response_not_serialized(mock_ssl_context, index_directory, template_file):
+    # Big binary files are not kept in memory
+    with patch.object(DocumentResponse, "SENDFILE_MIN_SIZE", 0):
+        document = DocumentResponse(
+            index_directory.join("image.png").strpath, index_directory.strpath
+        )
+    # Serialization errors are raised at request time, not at initialization
+    template = TemplateResponse(template_file)
+    app = App(urls={"/image": document, "/template": template}, config=ZeroConfig())
+    assert "_wire" not in document.__dict__
+    response = app.get_response("gemini://localhost/template")
+    with pytest.raises(TemplateError):
+        bytes(response)
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_timestamp_cached(mock_ssl_context, fake_handler):
+    app = App(urls={"": fake_handler}, config=ZeroConfig())
+    with patch("time.time", return_value=0.1):
+        timestamp = app.get_timestamp()
+    with patch("time.strftime") as mock_strftime, patch("time.time", return_value=0.9):
+        assert app.get_timestamp() == timestamp
+    assert not mock_strftime.called
+    with patch("time.time", return_value=3600.0):
+        assert app.get_timestamp() != timestamp
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_log_access(mock_ssl_context, fake_handler, fake_response):
+    app = App(urls={"": fake_handler}, config=ZeroConfig())
+    with patch.object(app, "log") as mock_log:
+        app.log_access("127.0.0.1", "gemini://localhost/\r\n", fake_response)
+    message = mock_log.call_args[0][0]
+    assert message.startswith("127.0.0.1 [")
+    assert message.endswith('] "gemini://localhost/" text/gemini 20 31')
+    assert mock_log.call_args[1] == {"error": False}
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_log_writer(mock_ssl_context, fake_handler):
+    app = App(urls={"": fake_handler}, config=ZeroConfig())
+    release = threading.Event()
+    # The output is blocked
+    with patch.object(app, "write_log", side_effect=lambda *args: release.wait()):
+        thread = app.start_log_writer()
+        # Messages are queued, and don't wait for the output
+        app.log("first")
+        app.log("second", error=True)
+        release.set()
+        app.stop_log_writer(thread)
+        assert app.write_log.call_args_list == [
+            call("first", False),
+            call("second", True),
+        ]
+    assert not thread.is_alive()
+
+    # Without the writer thread, messages are written right away
+    with patch.object(app, "write_log") as mock_write:
+        app.log("third")
+    mock_write.assert_called_once_with("third", False)
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_log_access_quiet(mock_ssl_context, fake_handler, fake_response):
+    config = ZeroConfig()
+    config.quiet = True
+    app = App(urls={"": fake_handler}, config=config)
+    with patch.object(app, "log") as mock_log:
+        app.log_access("127.0.0.1", "gemini://localhost/\r\n", fake_response)
+    assert not mock_log.called
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_args_config_lazy(mock_ssl_context, fake_handler):
+    with patch("gemeaux.ArgsConfig") as mock_config:
+        app = App(urls={"": fake_handler})
+        assert not mock_config.called
+        assert app.config is mock_config.return_value
+        assert app.config is mock_config.return_value
+    mock_config.assert_called_once_with()
@@ -33,6 +33,16 @@ def test_check_url_no_gemini():
     with pytest.raises(ProxyRequestRefusedException):
         check_url("https://localhost\r\n", PORT)
 
+    # Same error codes as with ``urlparse``
+    with pytest.raises(BadRequestException):
+        check_url("GEMINI://localhost/\r\n", PORT)
+    with pytest.raises(BadRequestException):
+        check_url("localhost/?u=http://x\r\n", PORT)
+    with pytest.raises(ProxyRequestRefusedException):
+        check_url("mailto:a@b\r\n", PORT)
+    with pytest.raises(ProxyRequestRefusedException):
+        check_url("HTTPS://localhost/\r\n", PORT)
+
 
 def test_check_url_length():
     # Max length of the stripped URL is 1024
@@ -10,6 +10,8 @@ def test_zero_config():
     assert config.certfile == "cert.pem"
     assert config.keyfile == "key.pem"
     assert config.nb_connections == 5
+    assert not config.quiet
+    assert not config.reuse_port
 
 
 def test_args_config():
@@ -21,3 +23,19 @@ def test_args_config():
     assert config.certfile == "cert.pem"
     assert config.keyfile == "key.pem"
     assert config.nb_connections == 5
+    assert not config.quiet
+    assert not config.reuse_port
+
+
+def test_args_config_quiet():
+    testargs = ["prog", "--quiet"]
+    with patch("sys.argv", testargs):
+        config = ArgsConfig()
+    assert config.quiet
+
+
+def test_args_config_reuse_port():
+    testargs = ["prog", "--reuse-port"]
+    with patch("sys.argv", testargs):
+        config = ArgsConfig()
+    assert config.reuse_port
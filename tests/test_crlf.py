@@ -11,3 +11,18 @@ def test_crlf_several_lf():
     content = bytes("line\n\n\nlast line", encoding="utf-8")
     content_expected = bytes("line\r\n\r\n\r\nlast line\r\n", encoding="utf-8")
     assert crlf(content) == content_expected
+
+
+def test_crlf_empty():
+    assert crlf(b"") == b""
+
+
+def test_crlf_already_normalized(multi_line_content_crlf):
+    content = bytes(multi_line_content_crlf, encoding="utf-8")
+    # No copy is made
+    assert crlf(content) is content
+
+    content = b"line\r\n\rlast line\r\n"
+    assert crlf(content) == b"line\r\n\r\nlast line\r\n"
+    content = b"line\r\n\nlast line\r\n"
+    assert crlf(content) == b"line\r\n\r\nlast line\r\n"
@@ -1,6 +1,6 @@
 from unittest.mock import patch
 
-from gemeaux import App, NotFoundResponse, ZeroConfig
+from gemeaux import App, DocumentResponse, NotFoundResponse, StaticHandler, ZeroConfig
 
 
 @patch("ssl.SSLContext.load_cert_chain")
@@ -32,3 +32,25 @@ def test_get_response_exception(mock_ssl_context, fake_handler_exception):
 
     response = app.get_response("/other")
     assert isinstance(response, NotFoundResponse)
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_get_response_not_found_shared(mock_ssl_context, fake_handler_exception):
+    app = App(urls={"/handler": fake_handler_exception}, config=ZeroConfig())
+    # No reason given: the default response is shared
+    assert app.get_response("/handler") is App.NOT_FOUND_RESPONSE
+    assert app.get_response("/other").reason == "Route Not Found"
+    # Same reason: same response
+    assert app.get_response("/other") is app.get_response("/other2")
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_get_response_view(mock_ssl_context, index_directory, fake_handler):
+    static_handler = StaticHandler(index_directory)
+    app = App(urls={"": static_handler, "/fake": fake_handler}, config=ZeroConfig())
+    # ``handle`` is not overridden: ``get_response`` is called directly
+    assert app._views[""] == static_handler.get_response
+    assert isinstance(app.get_response("/index.gmi"), DocumentResponse)
+    # ``handle`` is overridden
+    assert app._views["/fake"] == fake_handler.handle
+    assert app.get_response("/fake").origin == "handler"
@@ -37,3 +37,39 @@ def test_get_route_same_prefix(mock_ssl_context, fake_handler, fake_response):
     )
     assert app.get_route("/test") == ("/test", fake_handler)
     assert app.get_route("/test2") == ("/test2", fake_response)
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_get_route_longest_prefix(mock_ssl_context, fake_handler, fake_response):
+    app = App(
+        urls={"": fake_handler, "/test": fake_handler, "/test/sub": fake_response},
+        config=ZeroConfig(),
+    )
+    assert app.get_route("/test") == ("/test", fake_handler)
+    assert app.get_route("/test/") == ("/test", fake_handler)
+    assert app.get_route("/test/su") == ("/test", fake_handler)
+    assert app.get_route("/test/sub") == ("/test/sub", fake_response)
+    assert app.get_route("/test/sub/page.gmi") == ("/test/sub", fake_response)
+    assert app.get_route("/tes") == ("", fake_handler)
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_get_route_cached(mock_ssl_context, fake_handler):
+    app = App(urls={"/test": fake_handler}, config=ZeroConfig())
+    assert app.get_route("/test/page") == ("/test", fake_handler)
+    assert app.get_route("/test/page") == ("/test", fake_handler)
+    assert app._resolve.cache_info().hits == 1
+    # Lookup errors are not cached
+    with pytest.raises(FileNotFoundError):
+        app.get_route("/other")
+    with pytest.raises(FileNotFoundError):
+        app.get_route("/other")
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_get_route_exact_match(mock_ssl_context, fake_handler, fake_response):
+    app = App(urls={"": fake_handler, "/test": fake_response}, config=ZeroConfig())
+    assert app.get_route("/test") == ("/test", fake_response)
+    assert app.get_route("") == ("", fake_handler)
+    # Exact matches don't go through the trie
+    assert app._resolve.cache_info().misses == 0
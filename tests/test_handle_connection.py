@@ -0,0 +1,227 @@
+import asyncio
+import ssl
+from unittest.mock import patch
+
+from gemeaux import (
+    App,
+    BadRequestException,
+    DocumentResponse,
+    StaticHandler,
+    TextResponse,
+    ZeroConfig,
+)
+
+
+class FakeWriter:
+    transport = None
+
+    def __init__(self):
+        self.data = b""
+        self.writes = 0
+        self.closed = False
+
+    def get_extra_info(self, name):
+        return ("127.0.0.1", 12345)
+
+    def write(self, data):
+        self.data += data
+        self.writes += 1
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def handle(app, request, eof=True):
+    loop = asyncio.new_event_loop()
+    try:
+        reader = asyncio.StreamReader(limit=app.URL_MAX_LENGTH + 2, loop=loop)
+        reader.feed_data(request)
+        if eof:
+            reader.feed_eof()
+        writer = FakeWriter()
+        loop.run_until_complete(app.handle_connection(reader, writer))
+    finally:
+        loop.close()
+    return writer
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_handle_connection(mock_ssl_context):
+    response = TextResponse(title="Title", body="Body")
+    app = App(urls={"": response}, config=ZeroConfig())
+    app.port = 1965
+    with patch.object(app, "log_access") as mock_log:
+        writer = handle(app, b"gemini://localhost/\r\n")
+    assert writer.data == bytes(response)
+    assert writer.closed
+    mock_log.assert_called_once_with(
+        "127.0.0.1", "gemini://localhost/", response, len(writer.data)
+    )
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_handle_connection_binary_document(
+    mock_ssl_context, index_directory, image_content
+):
+    handler = StaticHandler(index_directory.strpath, cache_ttl=0)
+    app = App(urls={"": handler}, config=ZeroConfig())
+    app.port = 1965
+    with patch.object(app, "log_access") as mock_log:
+        writer = handle(app, b"gemini://localhost/image.png\r\n")
+    assert writer.data == b"20 image/png\r\n" + image_content
+    # Small file: header and body in a single write
+    assert writer.writes == 1
+    assert writer.closed
+    response, sent = mock_log.call_args[0][2:]
+    assert len(response) == sent == len(writer.data)
+
+    # Large file, no transport: buffered read/write fallback of the streaming path
+    with patch.object(DocumentResponse, "SENDFILE_MIN_SIZE", 0):
+        with patch.object(app, "log_access") as mock_log:
+            writer = handle(app, b"gemini://localhost/image.png\r\n")
+    assert writer.data == b"20 image/png\r\n" + image_content
+    assert writer.writes == 2
+    response, sent = mock_log.call_args[0][2:]
+    assert len(response) == sent == len(writer.data)
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_handle_connection_sendfile(mock_ssl_context, index_directory, image_content):
+    handler = StaticHandler(index_directory.strpath, cache_ttl=0)
+    app = App(urls={"": handler}, config=ZeroConfig())
+
+    async def request():
+        server = await asyncio.start_server(app.handle_connection, "127.0.0.1", 0)
+        app.port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", app.port)
+            writer.write(b"gemini://localhost/image.png\r\n")
+            data = await reader.read()
+            writer.close()
+        finally:
+            server.close()
+            await server.wait_closed()
+        return data
+
+    loop = asyncio.new_event_loop()
+    sendfile = loop.sendfile
+    try:
+        with patch.object(DocumentResponse, "SENDFILE_MIN_SIZE", 0):
+            with patch.object(app, "log_access") as mock_log:
+                with patch.object(loop, "sendfile", side_effect=sendfile) as mock:
+                    data = loop.run_until_complete(request())
+    finally:
+        loop.close()
+    assert data == b"20 image/png\r\n" + image_content
+    # Streamed from the file, through the real transport
+    assert mock.call_count == 1
+    fd = mock.call_args[0][1]
+    assert fd.name == index_directory.join("image.png").strpath
+    assert mock_log.call_args[0][3] == len(data)
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_handle_connection_streamed_file_removed(mock_ssl_context, index_directory):
+    handler = StaticHandler(index_directory.strpath)
+    app = App(urls={"": handler}, config=ZeroConfig())
+    app.port = 1965
+    with patch.object(DocumentResponse, "SENDFILE_MIN_SIZE", 0):
+        with patch.object(app, "log_access"):
+            handle(app, b"gemini://localhost/image.png\r\n")
+            # The cached response now points to a missing file
+            index_directory.join("image.png").remove()
+            with patch.object(app, "log"):
+                writer = handle(app, b"gemini://localhost/image.png\r\n")
+    # No success header before the error
+    assert writer.data == b"50 OS Error\r\n"
+    assert writer.closed
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_handle_connection_no_crlf(mock_ssl_context, fake_response):
+    app = App(urls={"": fake_response}, config=ZeroConfig())
+    app.port = 1965
+    writer = handle(app, b"gemini://localhost/")
+    assert writer.data == b""
+    assert writer.closed
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_handle_connection_timeout(mock_ssl_context, fake_response):
+    app = App(urls={"": fake_response}, config=ZeroConfig())
+    app.port = 1965
+    # The client stays silent, without closing the connection
+    with patch.object(App, "REQUEST_TIMEOUT", 0.01):
+        writer = handle(app, b"gemini://localhost/", eof=False)
+    assert writer.data == b""
+    assert writer.closed
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_handle_connection_too_long(mock_ssl_context, fake_response):
+    app = App(urls={"": fake_response}, config=ZeroConfig())
+    app.port = 1965
+    writer = handle(app, b"gemini://localhost/" + b"0" * 2048, eof=False)
+    assert writer.data == b"59 BAD REQUEST\r\n"
+    assert writer.closed
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_exception_handling(mock_ssl_context, fake_response):
+    app = App(urls={"": fake_response}, config=ZeroConfig())
+
+    writer = FakeWriter()
+    app.exception_handling(BadRequestException(), writer)
+    assert writer.data == b"59 BAD REQUEST\r\n"
+
+    writer = FakeWriter()
+    app.exception_handling(ssl.SSLEOFError(), writer)
+    assert writer.data == b"50 SSL Error\r\n"
+
+    writer = FakeWriter()
+    app.exception_handling(FileNotFoundError(), writer)
+    assert writer.data == b"50 OS Error\r\n"
+
+    writer = FakeWriter()
+    with patch.object(app, "log") as mock_log:
+        app.exception_handling(ConnectionResetError(), writer)
+    assert writer.data == b""
+    mock_log.assert_called_once_with("Connection reset by peer...", error=True)
+
+    writer = FakeWriter()
+    with patch.object(app, "log") as mock_log:
+        app.exception_handling(ValueError(), writer)
+    assert writer.data == b""
+    assert mock_log.called
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_handle_connection_fragmented(mock_ssl_context):
+    response = TextResponse(title="Title", body="Body")
+    app = App(urls={"": response}, config=ZeroConfig())
+    app.port = 1965
+    loop = asyncio.new_event_loop()
+    try:
+        reader = asyncio.StreamReader(limit=app.URL_MAX_LENGTH + 2, loop=loop)
+        writer = FakeWriter()
+        # The request line comes in several TCP segments
+        reader.feed_data(b"gemini://loc")
+        loop.call_soon(reader.feed_data, b"alhost/\r")
+        loop.call_soon(reader.feed_data, b"\n")
+        with patch.object(app, "log_access"):
+            loop.run_until_complete(app.handle_connection(reader, writer))
+    finally:
+        loop.close()
+    assert writer.data == bytes(response)
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_handle_connection_bad_encoding(mock_ssl_context, fake_response):
+    app = App(urls={"": fake_response}, config=ZeroConfig())
+    app.port = 1965
+    writer = handle(app, b"gemini://localhost/\xff\r\n")
+    assert writer.data == b"59 Unicode Decode Error\r\n"
+    assert writer.closed
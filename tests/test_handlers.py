@@ -1,4 +1,7 @@
+import ntpath
+import os
 from datetime import date
+from unittest.mock import patch
 
 import pytest
 
@@ -11,6 +14,8 @@ from gemeaux import (
     TemplateHandler,
     TemplateResponse,
 )
+from gemeaux.handlers import TTLCache
+from gemeaux.responses import FILE_CACHE
 
 
 def test_static_handler_not_a_directory():
@@ -167,3 +172,185 @@ def test_template_handler_classattr(template_file):
     assert response.status == 20
     expected_body = f"First var: {date.today()} / Second var: hello"
     assert response.__body__().startswith(bytes(expected_body, encoding="utf-8"))
+
+
+def test_static_handler_stat_cache(index_directory):
+    handler = StaticHandler(index_directory)
+    full_path = index_directory.join("index.gmi").strpath
+    assert handler.get_stat(full_path).st_size == os.stat(full_path).st_size
+    assert handler.get_stat(index_directory.join("not-found").strpath) is None
+
+    # Cached result, no stat call
+    with patch("os.stat") as mock_stat:
+        assert handler.get_stat(full_path) is not None
+        response = handler.build_response("", "/index.gmi")
+    assert not mock_stat.called
+    assert isinstance(response, DocumentResponse)
+
+    # Expired result
+    handler = StaticHandler(index_directory, cache_ttl=0)
+    assert handler.get_stat(full_path) is not None
+    with patch("os.stat", side_effect=FileNotFoundError) as mock_stat:
+        assert handler.get_stat(full_path) is None
+        with pytest.raises(FileNotFoundError):
+            handler.build_response("", "/index.gmi")
+    assert mock_stat.called
+
+
+def test_static_handler_response_cache(index_directory):
+    handler = StaticHandler(index_directory)
+    response = handler.get_response("", "/index.gmi")
+    assert handler.get_response("", "/index.gmi") is response
+    # Directory listings are cached until the directory changes
+    response = handler.get_response("", "/subdir/")
+    assert isinstance(response, DirectoryListingResponse)
+    assert handler.get_response("", "/subdir/") is response
+
+    # Expired responses
+    handler = StaticHandler(index_directory, cache_ttl=0)
+    response = handler.get_response("", "/index.gmi")
+    assert handler.get_response("", "/index.gmi") is not response
+
+
+def test_static_handler_response_cache_big_file(index_directory):
+    handler = StaticHandler(index_directory)
+    # Bigger than the file cache limit: not kept in memory
+    with patch.object(FILE_CACHE, "max_file_size", 1):
+        response = handler.get_response("", "/index.gmi")
+        assert handler.get_response("", "/index.gmi") is not response
+
+
+def test_ttl_cache():
+    cache = TTLCache(ttl=None, maxsize=3)
+    for key in ("hot", "a", "b"):
+        cache.set(key, key)
+    # Refreshed entries are evicted last
+    cache.set("hot", "hot")
+    cache.set("c", "c")
+    assert list(cache._data) == ["b", "hot", "c"]
+
+    # Expired entries are dropped
+    cache = TTLCache(ttl=0, maxsize=3)
+    cache.set("key", "value")
+    assert cache.get("key") is None
+    assert not cache._data
+
+
+def test_ttl_cache_purge_expired():
+    cache = TTLCache(ttl=1, maxsize=10)
+    with patch("time.monotonic", return_value=100):
+        cache.set("a", "a", size=10)
+        cache.set("b", "b", size=20)
+    # Setting a new entry drops the expired ones, even if never looked up again
+    with patch("time.monotonic", return_value=101):
+        cache.set("c", "c", size=5)
+    assert list(cache._data) == ["c"]
+    assert cache.nbytes == 5
+
+
+def test_ttl_cache_maxbytes():
+    cache = TTLCache(ttl=None, maxsize=10, maxbytes=100)
+    cache.set("a", "a", size=60)
+    cache.set("b", "b", size=30)
+    cache.set("a", "a", size=50)
+    assert cache.nbytes == 80
+    cache.set("c", "c", size=40)
+    assert list(cache._data) == ["a", "c"]
+    assert cache.nbytes == 90
+    cache.clear()
+    assert cache.nbytes == 0
+
+
+def test_static_handler_response_cache_budget(index_directory):
+    handler = StaticHandler(index_directory)
+    response = handler.get_response("", "/index.gmi")
+    size = len(response.content) + len(response)
+    assert handler._response_cache.nbytes == size
+    # The budget is full: the oldest response is evicted
+    handler._response_cache.maxbytes = size
+    handler.get_response("", "/other.gmi")
+    assert handler.get_response("", "/index.gmi") is not response
+
+
+def test_static_handler_parent_directory(index_directory):
+    handler = StaticHandler(index_directory.join("subdir"))
+    with pytest.raises(FileNotFoundError):
+        handler.get_response("", "/../index.gmi")
+    with pytest.raises(FileNotFoundError):
+        handler.get_response("", "/sub.gmi/../../index.gmi")
+    with pytest.raises(FileNotFoundError):
+        handler.get_response("", "//etc/passwd")
+    with pytest.raises(FileNotFoundError):
+        handler.get_response("", "/..\\index.gmi")
+    # Rejected before any filesystem access
+    with patch("os.stat") as mock_stat:
+        with pytest.raises(FileNotFoundError):
+            handler.get_response("", "/sub.gmi/../sub.gmi")
+    assert not mock_stat.called
+
+
+def test_static_handler_drive_path(index_directory):
+    handler = StaticHandler(index_directory)
+    # Windows path semantics
+    with patch("gemeaux.handlers.splitdrive", ntpath.splitdrive):
+        with pytest.raises(FileNotFoundError):
+            handler.get_response("", "/C:/Windows/win.ini")
+        with pytest.raises(FileNotFoundError):
+            handler.get_response("", "/D:secret.txt")
+        # Regular paths are still served
+        assert isinstance(handler.get_response("", "/index.gmi"), DocumentResponse)
+
+
+def test_static_handler_non_canonical_path(index_directory, sub_content):
+    handler = StaticHandler(index_directory)
+    response = handler.get_response("", "/./subdir//sub.gmi")
+    assert response.content == bytes(sub_content, encoding="utf-8")
+
+    response = handler.get_response("", "/./subdir/")
+    assert response.content.startswith(b"# Directory listing for `/subdir`\r\n")
+
+    # Root directory listing
+    index_directory.join("index.gmi").remove()
+    response = StaticHandler(index_directory).get_response("", "/")
+    assert response.content.startswith(b"# Directory listing for ``\r\n")
+    assert b"=> /other.gmi\r\n" in response.content
+
+
+def test_static_handler_single_stat(index_directory, other_content):
+    handler = StaticHandler(index_directory)
+    # The handler stat result is passed to the response
+    with patch("gemeaux.responses.stat") as mock_stat:
+        response = handler.get_response("", "/other.gmi")
+    assert not mock_stat.called
+    assert response.content == bytes(other_content, encoding="utf-8")
+    full_path = index_directory.join("other.gmi").strpath
+    assert response.size == handler.get_stat(full_path).st_size
+
+
+def test_static_handler_listing_cache(index_directory):
+    handler = StaticHandler(index_directory, cache_ttl=0)
+    response = handler.get_response("", "/subdir/")
+    assert handler.get_response("", "/subdir/") is response
+
+    # A new file in the directory
+    subdir = index_directory.join("subdir")
+    mtime_ns = os.stat(subdir.strpath).st_mtime_ns
+    subdir.join("new.gmi").write_text("new", encoding="utf-8")
+    os.utime(subdir.strpath, ns=(mtime_ns + 1, mtime_ns + 1))
+    new_response = handler.get_response("", "/subdir/")
+    assert new_response is not response
+    assert b"=> /subdir/new.gmi\r\n" in new_response.content
+
+
+def test_static_handler_listing_single_stat(index_directory):
+    handler = StaticHandler(index_directory, cache_ttl=0)
+    subdir = os.path.join(index_directory.strpath, "subdir/")
+    # The directory stat is only found once: the listing has to reuse it.
+    stats = {subdir: os.stat(subdir)}
+
+    def get_stat(full_path):
+        return stats.pop(full_path, None)
+
+    with patch.object(handler, "get_stat", side_effect=get_stat):
+        response = handler.get_response("", "/subdir/")
+    assert isinstance(response, DirectoryListingResponse)
@@ -0,0 +1,53 @@
+from gemeaux import get_path, parse_url
+
+
+def test_parse_url_root():
+    assert parse_url("gemini://localhost\r\n") == ("gemini", "localhost", None, "", "")
+    assert parse_url("gemini://localhost/\r\n") == (
+        "gemini",
+        "localhost",
+        None,
+        "/",
+        "",
+    )
+
+
+def test_parse_url_port():
+    assert parse_url("gemini://localhost:1965/\r\n") == (
+        "gemini",
+        "localhost",
+        "1965",
+        "/",
+        "",
+    )
+
+
+def test_parse_url_query():
+    assert parse_url("gemini://localhost?hello\r\n") == (
+        "gemini",
+        "localhost",
+        None,
+        "",
+        "hello",
+    )
+    assert parse_url("gemini://localhost/path/?hello%20world#frag\r\n") == (
+        "gemini",
+        "localhost",
+        None,
+        "/path/",
+        "hello%20world",
+    )
+
+
+def test_parse_url_other_scheme():
+    assert parse_url("https://localhost/\r\n")[0] == "https"
+
+
+def test_parse_url_no_scheme():
+    assert parse_url("localhost\r\n") == ("gemini", "", None, "localhost", "")
+
+
+def test_get_path():
+    assert get_path("gemini://localhost/path/page.gmi?query\r\n") == "/path/page.gmi"
+    assert get_path("/handler") == "/handler"
+    assert get_path("") == ""
@@ -1,3 +1,6 @@
+import os
+from unittest.mock import patch
+
 import pytest
 
 from gemeaux import (
@@ -18,12 +21,12 @@ from gemeaux import (
     TextResponse,
     crlf,
 )
+from gemeaux.responses import FileCache, guess_mimetype
 
 
 def test_base_response():
     response = Response()
-    with pytest.raises(NotImplementedError):
-        response.status
+    assert response.status is None
     assert response.__body__() is None
     with pytest.raises(NotImplementedError):
         response.__meta__()
@@ -121,7 +124,10 @@ def test_document_response(index_directory, index_content):
     bytes_content = bytes(index_content, encoding="utf-8")
     bytes_body = b"20 text/gemini\r\n" + bytes_content + b"\r\n"
     assert response.__body__() == bytes_content
+    # Serialized at initialization
+    assert response._wire == bytes_body
     assert bytes(response) == bytes_body
+    assert len(response) == len(bytes_body)
 
 
 def test_document_response_not_in_root_dir(index_directory):
@@ -168,10 +174,26 @@ def test_directory_listing(index_directory):
     assert response.status == 20
     assert response.__meta__() == b"20 text/gemini; charset=utf-8"
     assert response.__body__().startswith(b"# Directory listing for ``")
-    assert b"=> /subdir" in response.__body__()
+    assert b"=> /subdir/\r\n" in response.__body__()
     assert b"=> /other.gmi" in response.__body__()
 
 
+def test_directory_listing_sorted(index_directory):
+    index_directory.join("Zebra.gmi").write_text("Zebra", encoding="utf-8")
+    response = DirectoryListingResponse(
+        index_directory.strpath, index_directory.strpath
+    )
+    assert response.__body__() == (
+        b"# Directory listing for ``\r\n\r\n"
+        b"=> /image.png\r\n"
+        b"=> /index.gmi\r\n"
+        b"=> /multi_line.gmi\r\n"
+        b"=> /other.gmi\r\n"
+        b"=> /subdir/\r\n"
+        b"=> /Zebra.gmi\r\n"
+    )
+
+
 def test_directory_listing_crlf(index_directory):
     response = DirectoryListingResponse(
         index_directory.strpath, index_directory.strpath
@@ -263,3 +285,72 @@ def test_template_response_not_a_template():
         TemplateResponse("/tmp/not-a-template")
     except Exception as exc:
         assert exc.args == ("Template file not found: `/tmp/not-a-template`",)
+
+
+def test_template_response_cached(template_file):
+    response = TemplateResponse(template_file, var1="value1", var2="value2")
+    # Cache hit: the file is not read again
+    with patch("builtins.open") as mock_open:
+        other = TemplateResponse(template_file, var1="value1", var2="value2")
+    assert not mock_open.called
+    assert other.template is response.template
+
+    # The template has changed
+    template_file.write_text("Changed: $var1", encoding="utf-8")
+    stat_result = os.stat(template_file.strpath)
+    os.utime(
+        template_file.strpath,
+        ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1),
+    )
+    response = TemplateResponse(template_file, var1="value1")
+    assert response.__body__() == b"Changed: value1"
+
+
+def test_file_cache(index_directory, index_content):
+    cache = FileCache(maxsize=1)
+    path = index_directory.join("index.gmi").strpath
+    content = bytes(index_content, encoding="utf-8")
+    assert cache.read(path, os.stat(path)) == content
+    assert cache.nbytes == len(content)
+
+    # Cache hit: the file is not opened
+    with patch("builtins.open") as mock_open:
+        assert cache.read(path, os.stat(path)) == content
+    assert not mock_open.called
+
+    # The file has changed
+    index_directory.join("index.gmi").write_binary(b"new content")
+    stat_result = os.stat(path)
+    os.utime(path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1))
+    assert cache.read(path, os.stat(path)) == b"new content"
+    assert cache.nbytes == len(b"new content")
+
+    # Evicted
+    other = index_directory.join("other.gmi").strpath
+    cache.read(other, os.stat(other))
+    assert list(cache._data) == [other]
+
+    cache.clear()
+    assert not cache._data
+    assert cache.nbytes == 0
+
+
+def test_document_response_sibling_root_dir(tmpdir_factory):
+    root = tmpdir_factory.mktemp("root")
+    sibling = tmpdir_factory.getbasetemp().join(root.basename + "-secret")
+    sibling.mkdir()
+    sibling.join("secret.gmi").write_text("secret", encoding="utf-8")
+    with pytest.raises(FileNotFoundError):
+        DocumentResponse(sibling.join("secret.gmi").strpath, root.strpath)
+    with pytest.raises(FileNotFoundError):
+        DirectoryListingResponse(sibling.strpath, root.strpath)
+
+
+def test_guess_mimetype():
+    assert guess_mimetype("gmi") == "text/gemini"
+    assert guess_mimetype("png") == "image/png"
+    assert guess_mimetype("tar.gz") == "application/x-tar; charset=gzip"
+    assert guess_mimetype("") == "application/octet-stream"
+    hits = guess_mimetype.cache_info().hits
+    assert guess_mimetype("gmi") == "text/gemini"
+    assert guess_mimetype.cache_info().hits == hits + 1